@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+"""Cold start of every app: module-level import cost and time to the first rendered outputs.
+
+Every app is started in a fresh interpreter, the way it is started in a new browser tab. The libraries the app
+imports are timed one after another before the app module runs, so each number is the cost that library adds on top of
+the ones before it. The first render is driven by a mock session which sends the default value of every input found in
+the app's UI, just like the browser does on connect.
+
+Run from the repository root: python benchmarks/cold_start.py [--repeat 3] [--output benchmarks/reports/cold_start]
+"""
+from html.parser import HTMLParser
+from pathlib import Path
+import argparse
+import ast
+import asyncio
+import importlib
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+libraries = ["numpy", "pandas", "scipy", "matplotlib", "plotly", "shiny", "shinywidgets"]
+slider_steps = 5
+output_size = 400
+settle = 0.5
+timeout = 30.0
+
+
+def discover_apps():
+    """Same discovery as gen_shinylive.py: every app.py below a directory with an app.md."""
+    apps = []
+    for file_path in sorted(Path("docs").glob("**/app.md")):
+        for app_path in sorted(file_path.parent.glob("**/app.py")):
+            apps.append(app_path)
+    return apps
+
+
+def imported_modules(app_path):
+    """Modules imported at the top level of the app, grouped by the libraries they belong to."""
+    tree = ast.parse(Path(app_path).read_text(encoding="utf-8"))
+    modules = {}
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            if name.split(".")[0] in libraries:
+                modules.setdefault(name.split(".")[0], []).append(name)
+    return modules
+
+
+def number(text):
+    """Numbers as the browser sends them, integers stay integers."""
+    return float(text) if any(c in text for c in ".eE") else int(text)
+
+
+def slider_values(attrs):
+    """slider_steps values spread over the range of a slider, on its steps."""
+    low, high, step = number(attrs["data-min"]), number(attrs["data-max"]), number(attrs["data-step"])
+    n_steps = round((high - low) / step)
+    values = [low + round(i * n_steps / (slider_steps - 1)) * step for i in range(slider_steps)]
+    return sorted({round(value, 10) if isinstance(value, float) else value for value in values})
+
+
+class InputParser(HTMLParser):
+    """Collects the initial input values, the values they can take and the output ids from a rendered app UI."""
+
+    def __init__(self):
+        super().__init__()
+        self.inputs = {}
+        self.choices = {}
+        self.outputs = {}  # output id -> hidden
+        self.select_id = None
+        self.tabset_id = None
+        # Outputs in conditional panels or inactive tabs are hidden in the browser and not rendered on start
+        self.div_depth = 0
+        self.hidden_depth = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        element_id = attrs.get("id")
+
+        if tag == "div":
+            self.div_depth += 1
+            hidden = "data-display-if" in attrs or ("tab-pane" in classes and "active" not in classes)
+            if hidden and self.hidden_depth is None:
+                self.hidden_depth = self.div_depth
+
+        if element_id and any(c.startswith("shiny-") and c.endswith("-output") for c in classes):
+            self.outputs[element_id] = self.hidden_depth is not None
+        elif tag == "input" and "js-range-slider" in classes and attrs.get("data-data-type") == "number":
+            value = [number(attrs["data-from"]), number(attrs["data-to"])] if attrs.get("data-type") == "double" \
+                else number(attrs["data-from"])
+            self.inputs[element_id] = value
+            if attrs.get("data-type") != "double":
+                self.choices[element_id] = slider_values(attrs)
+        elif tag == "input" and attrs.get("type") == "radio":
+            if "checked" in attrs or attrs["name"] not in self.inputs:
+                self.inputs[attrs["name"]] = attrs["value"]
+            self.choices.setdefault(attrs["name"], []).append(attrs["value"])
+        elif tag == "input" and attrs.get("type") == "checkbox" and element_id:
+            self.inputs[element_id] = "checked" in attrs
+            self.choices[element_id] = [False, True]
+        elif tag == "input" and attrs.get("type") == "number" and element_id:
+            self.inputs[element_id] = number(attrs["value"]) if attrs.get("value") else None
+        elif (tag == "textarea" or attrs.get("type") == "text") and element_id:
+            self.inputs[element_id] = attrs.get("value", "")
+        elif tag == "select" and element_id:
+            self.select_id = element_id
+        elif tag == "option" and self.select_id:
+            if "selected" in attrs or self.select_id not in self.inputs:
+                self.inputs[self.select_id] = attrs.get("value")
+            self.choices.setdefault(self.select_id, []).append(attrs.get("value"))
+        elif "action-button" in classes and element_id:
+            self.inputs[f"{element_id}:shiny.action"] = 0
+        elif tag == "bslib-input-dark-mode" and element_id:
+            self.inputs[element_id] = attrs.get("mode", "light")
+            self.choices[element_id] = ["light", "dark"]
+        elif "shiny-tab-input" in classes and element_id:
+            self.tabset_id = element_id
+        elif tag == "a" and self.tabset_id and "data-value" in attrs:
+            if "active" in classes or self.tabset_id not in self.inputs:
+                self.inputs[self.tabset_id] = attrs["data-value"]
+            self.choices.setdefault(self.tabset_id, []).append(attrs["data-value"])
+
+    def handle_endtag(self, tag):
+        if tag == "div":
+            if self.hidden_depth == self.div_depth:
+                self.hidden_depth = None
+            self.div_depth -= 1
+        elif tag == "select":
+            self.select_id = None
+        elif tag == "ul":
+            self.tabset_id = None
+
+
+def load_app(app_path):
+    from shiny.express import is_express_app, wrap_express_app
+    if is_express_app(str(app_path), None):
+        return wrap_express_app(Path(app_path).resolve())
+    spec = importlib.util.spec_from_file_location("app", app_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.app
+
+
+async def first_render(app, init, outputs):
+    """Seconds from the init message until each output first received a value or an error, and the failed outputs."""
+    from shiny._connection import MockConnection
+
+    rendered = {}
+    errors = set()
+    start = time.perf_counter()
+
+    class Connection(MockConnection):
+        async def send(self, message):
+            message = json.loads(message)
+            for output_id in {**message.get("values", {}), **message.get("errors", {})}:
+                rendered.setdefault(output_id, time.perf_counter() - start)
+            errors.update(message.get("errors", {}))
+
+    connection = Connection()
+    session = app._create_session(connection)
+    task = asyncio.create_task(session._run())
+    connection.cause_receive(json.dumps({"method": "init", "data": init}))
+
+    # Wait for all outputs, or until nothing more is rendered for a while as some outputs need a click first
+    last_count, last_change = 0, time.perf_counter()
+    while time.perf_counter() - start < timeout and not set(outputs) <= set(rendered):
+        await asyncio.sleep(0.05)
+        if len(rendered) != last_count:
+            last_count, last_change = len(rendered), time.perf_counter()
+        elif rendered and time.perf_counter() - last_change > settle:
+            break
+    connection.cause_disconnect()
+    await asyncio.sleep(0.05)
+    task.cancel()
+    return rendered, errors
+
+
+def parse_ui(app):
+    parser = InputParser()
+    parser.feed(app.ui["html"] if isinstance(app.ui, dict) else "")
+    return parser
+
+
+def initial_message(parser):
+    """Data of the init message the browser sends on connect."""
+    init = dict(parser.inputs)
+    init[".clientdata_pixelratio"] = 1
+    for output_id, hidden in parser.outputs.items():
+        init[f".clientdata_output_{output_id}_width"] = output_size
+        init[f".clientdata_output_{output_id}_height"] = output_size
+        init[f".clientdata_output_{output_id}_hidden"] = hidden
+    return init
+
+
+def profile_app(app_path):
+    """Runs in the child process, returns the timings of a single cold start."""
+    app_path = Path(app_path).resolve()
+    sys.path.insert(0, str(app_path.parent))
+    os.chdir(app_path.parent)
+
+    result = {"imports": {}}
+    for library, modules in sorted(imported_modules(app_path).items(), key=lambda item: libraries.index(item[0])):
+        start = time.perf_counter()
+        for module in modules:
+            importlib.import_module(module)
+        result["imports"][library] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    app = load_app(app_path)
+    result["app_module"] = time.perf_counter() - start
+
+    parser = parse_ui(app)
+    init = initial_message(parser)
+    visible = [output_id for output_id, hidden in parser.outputs.items() if not hidden]
+    rendered, errors = asyncio.run(first_render(app, init, visible))
+    outputs = [rendered[output_id] for output_id in visible if output_id in rendered]
+    result["first_output"] = min(outputs, default=None)
+    result["all_outputs"] = max(outputs, default=None)
+    result["outputs_rendered"] = len(outputs)
+    result["output_errors"] = sorted(errors)
+    result["outputs"] = len(visible)
+    return result
+
+
+def run_child(app_path):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])))
+    process = subprocess.run([sys.executable, __file__, "--child", str(app_path)], capture_output=True, text=True,
+                             env=env)
+    lines = process.stdout.strip().splitlines()
+    if process.returncode != 0 or not lines:
+        error = process.stderr.strip().splitlines()
+        return {"error": error[-1] if error else f"exit code {process.returncode}"}
+    return json.loads(lines[-1])
+
+
+def median_result(runs):
+    """Median of every timing over repeated cold starts."""
+    if any("error" in run for run in runs):
+        return next(run for run in runs if "error" in run)
+    median = lambda values: statistics.median(values) if None not in values else None
+    result = {key: median([run[key] for run in runs]) for key in ("app_module", "first_output", "all_outputs")}
+    result["imports"] = {library: median([run["imports"][library] for run in runs]) for library in runs[0]["imports"]}
+    result["outputs_rendered"] = min(run["outputs_rendered"] for run in runs)
+    result["output_errors"] = sorted(set().union(*(run["output_errors"] for run in runs)))
+    result["outputs"] = runs[0]["outputs"]
+    return result
+
+
+def markdown_report(report):
+    ms = lambda seconds: "" if seconds is None else f"{1e3 * seconds:.0f}"
+    lines = [f"Cold start in ms, median of {report['repeat']} runs, Python {report['python']}.", "",
+             "| app | " + " | ".join(libraries) + " | app module | first output | all outputs | rendered | errors |",
+             "|---|" + "---:|" * (len(libraries) + 4) + "---|"]
+    for app, result in report["apps"].items():
+        if "error" in result:
+            lines.append(f"| {app} | " + " | " * (len(libraries) + 4) + f"{result['error']} |")
+            continue
+        imports = [ms(result["imports"].get(library)) for library in libraries]
+        lines.append(f"| {app} | " + " | ".join(imports) + f" | {ms(result['app_module'])} | "
+                     f"{ms(result['first_output'])} | {ms(result['all_outputs'])} | "
+                     f"{result['outputs_rendered']}/{result['outputs']} | {', '.join(result['output_errors'])} |")
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arguments.add_argument("--repeat", type=int, default=3, help="cold starts per app, the median is reported")
+    arguments.add_argument("--output", default="benchmarks/reports/cold_start",
+                           help="path of the report without suffix, .json and .md are written")
+    arguments.add_argument("--child", help=argparse.SUPPRESS)
+    args = arguments.parse_args()
+
+    if args.child:
+        print(json.dumps(profile_app(args.child)))
+        sys.exit()
+
+    report = {"python": sys.version.split()[0], "repeat": args.repeat, "apps": {}}
+    for app_path in discover_apps():
+        name = app_path.parent.relative_to("docs").as_posix()
+        report["apps"][name] = median_result([run_child(app_path) for _ in range(args.repeat)])
+        print(f"{name}: {report['apps'][name]}")
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.with_suffix(".json").write_text(json.dumps(report, indent=2))
+    output.with_suffix(".md").write_text(markdown_report(report))
+    print(markdown_report(report))
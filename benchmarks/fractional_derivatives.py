@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""Accuracy against runtime of the FractionalDerivatives engines, on the default e**(-x**2).
+
+The reference is the exact Fourier (Liouville) derivative of the Gaussian: its transform sqrt(pi) e^(-k^2/4) times
+(ik)^order, transformed back by quadrature. The lower terminal of Grünwald–Letnikov and Caputo is put at the start of
+the domain, where the Gaussian vanishes, so that all three definitions agree. Errors are taken over the visible range
+and relative to the largest value of the reference there, for a few orders and the worst of all orders of the slider.
+
+Run from the repository root: python benchmarks/fractional_derivatives.py [--repeat 5]
+"""
+from pathlib import Path
+import argparse
+import importlib.util
+import json
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, ".")  # shared teaching package
+app_path = Path("docs", "apps", "FractionalDerivatives", "app.py")
+spec = importlib.util.spec_from_file_location("fractional_derivatives", app_path)
+app = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app)
+
+formula = "e**(-x**2)"
+reference_step = 8  # Every 8th sample of the visible range
+reported_orders = [0.5, 1.5, 2.5, 3.5]
+
+
+def reference(x, orders):
+    """Exact derivatives, the quadrature runs over u with k = u^4, which smooths the k^order kink at k = 0."""
+    u = np.linspace(0, 40 ** 0.25, 20001)
+    k = u ** 4
+    weights = np.full(len(u), u[1] - u[0])
+    weights[[0, -1]] /= 2
+    weights *= 4 * u ** 3 * np.sqrt(np.pi) * np.exp(-k ** 2 / 4) / np.pi  # dk, transform and 1 / 2pi for both signs
+    result = np.empty((len(orders), len(x)))
+    for i, order in enumerate(orders):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            multiplier = np.where(k > 0, (1j * k) ** order, order == 0)
+        result[i] = np.real(np.exp(1j * np.outer(x, k)) @ (weights * multiplier))
+    return result
+
+
+def engines(f):
+    """Name, domain and a function computing all orders, for every engine and domain."""
+    for domain in ["fixed", "adaptive"]:
+        factor = app.adaptive_factor(f) if domain == "adaptive" else app.max_factor
+        m = round(app.xrange * factor / app.dx)
+        x = app.dx * np.arange(-m, m + 1)
+        y = f(x)
+        for padding in ["fast", "double"]:
+            yield (f"Fourier, {padding} padding", domain, x,
+                   lambda x=x, y=y, padding=padding: app.fractional_derivatives(
+                       app.spectrum(y, app.dx, padding), app.orders, len(x)))
+        yield "Grünwald–Letnikov", domain, x, lambda y=y: app.grunwald_letnikov(y, app.dx, app.orders)
+        coefficients = np.zeros(int(np.ceil(app.order_max)))  # The Gaussian vanishes at the terminal
+        yield "Caputo", domain, x, lambda x=x, y=y: app.caputo(x, y, app.dx, app.orders, x[0], coefficients)
+
+
+def markdown_report(report):
+    lines = [f"FractionalDerivatives engines on {report['formula']}, all {report['orders']} orders, "
+             f"best of {report['repeat']} runs.", "",
+             "| engine | domain | samples | ms | max error | " + " | ".join(f"order {order:g}" for order in reported_orders)
+             + " |", "|---|---|" + "---:|" * (3 + len(reported_orders))]
+    for row in report["engines"]:
+        lines.append(f"| {row['engine']} | {row['domain']} | {row['samples']} | {1e3 * row['seconds']:.1f} | "
+                     f"{row['max_error']:.1e} | " + " | ".join(f"{row['errors'][f'{order:g}']:.1e}"
+                                                              for order in reported_orders) + " |")
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arguments.add_argument("--repeat", type=int, default=5, help="runs per engine, the fastest is reported")
+    arguments.add_argument("--output", default="benchmarks/reports/fractional_derivatives",
+                           help="path of the report without suffix, .json and .md are written")
+    args = arguments.parse_args()
+
+    f = app.expressions.compile_expression(formula, "x")
+    visible = round(app.xrange / app.dx)
+    x_reference = app.dx * np.arange(-visible, visible + 1, reference_step)
+    exact = reference(x_reference, app.orders)
+    scale = np.max(np.abs(exact), axis=1)
+
+    report = {"formula": formula, "orders": len(app.orders), "repeat": args.repeat, "engines": []}
+    for name, domain, x, compute in engines(f):
+        seconds = min(timeit.repeat(compute, number=1, repeat=args.repeat))
+        y_derivs = compute()
+        indices = np.searchsorted(x, x_reference - app.dx / 2)
+        errors = np.max(np.abs(y_derivs[:, indices] - exact), axis=1) / scale
+        report["engines"].append({"engine": name, "domain": domain, "samples": len(x), "seconds": seconds,
+                                  "max_error": float(np.max(errors)),
+                                  "errors": {f"{order:g}": float(error) for order, error in zip(app.orders, errors)}})
+        print(f"{name}, {domain}: {1e3 * seconds:.1f} ms, max error {np.max(errors):.1e}")
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.with_suffix(".json").write_text(json.dumps(report, indent=2))
+    output.with_suffix(".md").write_text(markdown_report(report))
+    print(markdown_report(report))
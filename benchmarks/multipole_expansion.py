@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Per-plot latency of the MultipoleExpansion potentials, before and after the precomputed radial basis.
+
+Run from the repository root: python benchmarks/multipole_expansion.py
+"""
+from pathlib import Path
+import importlib.util
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, ".")  # shared teaching package
+app_path = Path("docs", "apps", "MultipoleExpansion", "app.py")
+spec = importlib.util.spec_from_file_location("multipole_expansion", app_path)
+app = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app)
+
+moment_q, moment_p, moment_qij, moment_oijk = app.calculate_moments(app.example_charges["quadrupole"])
+
+
+def direct_monopole(moment_q, eps=1e-10):
+    # The previous implementation, which rebuilt every factor on each render
+    X1, X2 = np.meshgrid(app.x1_axis, app.x2_axis)
+    r = np.sqrt(X1 ** 2 + X2 ** 2)
+    return moment_q / (r + eps)
+
+
+def direct_dipole(moment_p, plane, eps=1e-10):
+    i, j = app.plane_axes[plane]
+    X1, X2 = np.meshgrid(app.x1_axis, app.x2_axis)
+    r = np.sqrt(X1 ** 2 + X2 ** 2)
+    return (moment_p[i] * X1 + moment_p[j] * X2) / ((r + eps) ** 3)
+
+
+def direct_quadrupole(moment_qij, plane, eps=1e-10):
+    i, j = app.plane_axes[plane]
+    X1, X2 = np.meshgrid(app.x1_axis, app.x2_axis)
+    r = np.sqrt(X1 ** 2 + X2 ** 2)
+    return 0.5 * (moment_qij[i, i] * X1 * X1 + moment_qij[j, j] * X2 * X2 + moment_qij[j, i] * X1 * X2
+                  + moment_qij[i, j] * X2 * X1) / ((r + eps) ** 5)
+
+
+def basis_potential(moment, plane):
+    return app.multipole_potential(moment, [plane])[0]
+
+
+cases = {
+    "monopole": (direct_monopole, basis_potential, (moment_q,), (moment_q, "xz")),
+    "dipole": (direct_dipole, basis_potential, (moment_p, "xz"), (moment_p, "xz")),
+    "quadrupole": (direct_quadrupole, basis_potential, (moment_qij, "xz"), (moment_qij, "xz")),
+}
+
+
+def best_of(func, args, repeat=7, number=10):
+    return min(timeit.repeat(lambda: func(*args), repeat=repeat, number=number)) / number
+
+
+build_time = best_of(app.radial_basis, (app.x1_axis, app.x2_axis), repeat=3, number=1)
+print(f"grid: {len(app.x1_axis)}x{len(app.x2_axis)}, one-off basis construction: {build_time * 1e3:.1f} ms")
+print(f"{'potential':<12}{'before':>10}{'after':>10}{'speed-up':>10}")
+for name, (before, after, args_before, args_after) in cases.items():
+    np.testing.assert_allclose(after(*args_after), before(*args_before), rtol=1e-9, atol=1e-12)
+    t_before = best_of(before, args_before)
+    t_after = best_of(after, args_after)
+    print(f"{name:<12}{t_before * 1e3:>8.2f}ms{t_after * 1e3:>8.2f}ms{t_before / t_after:>9.1f}x")
+
+# All orders on all three planes, batched per order as in the app
+t_batched = best_of(lambda: [app.multipole_potential(moment) for moment in
+                             (moment_q, moment_p, moment_qij, moment_oijk)], ())
+print(f"orders 0-3 on all planes: {t_batched * 1e3:.2f}ms")
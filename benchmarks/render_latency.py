@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""Render latency of every output for changes of every input, for all apps.
+
+Each app's server runs against a mock session, which receives the same init and update messages the browser sends
+and turns them into the app's `input`. Every slider (at a few points of its range), radio button, select, checkbox,
+tab and dark mode toggle is swept in turn, returning to its initial value after each sweep. For every change the
+time until each output is recalculated is recorded, and its p50/p95 over all changes is reported, together with the
+median bytes the server sends to the browser per change. Outputs that are hidden at start (conditional panels,
+inactive tabs) stay hidden, as the browser only reports what it shows.
+
+Run from the repository root: python benchmarks/render_latency.py [--repeat 5] [--app MultipoleExpansion]
+Pass --baseline benchmarks/reports/render_latency.json to exit with an error when an output got slower.
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+
+from cold_start import discover_apps, initial_message, load_app, parse_ui
+
+timeout = 30.0
+# Wait this long after an update was processed, MultipoleExpansion refines its plots 0.5 s after the last change
+settle = 0.6
+
+
+def percentile(values, q):
+    """Nearest-rank percentile, q in [0, 100]."""
+    values = sorted(values)
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+class Client:
+    """Plays the browser: sends messages to a session and records when outputs were recalculated."""
+
+    def __init__(self, app):
+        from shiny._connection import MockConnection
+
+        client = self
+
+        class Connection(MockConnection):
+            async def send(self, message):
+                client.bytes += len(message.encode())
+                client.receive(json.loads(message))
+
+        self.connection = Connection()
+        self.session = app._create_session(self.connection)
+        self.recalculated = {}
+        self.busy = False
+        self.bytes = 0
+        self.last_message = time.perf_counter()
+        self.last_output = time.perf_counter()
+        # Animations keep the session busy, for them an update is done once no further output follows for a while
+        self.animated = False
+
+    def receive(self, message):
+        self.last_message = time.perf_counter()
+        status = message.get("recalculating", {})
+        if status.get("status") == "recalculated" and status["name"] not in self.recalculated:
+            self.recalculated[status["name"]] = self.last_output = self.last_message
+        if "busy" in message:
+            self.busy = message["busy"] == "busy"
+
+    async def send(self, method, data):
+        """Seconds until each output was recalculated after the message, and the bytes sent back in that time."""
+        self.recalculated = {}
+        self.bytes = 0
+        start = time.perf_counter()
+        self.connection.cause_receive(json.dumps({"method": method, "data": data}))
+        # Changes that invalidate nothing never make the session busy, so wait for it to be quiet instead of idle
+        while time.perf_counter() - start < timeout:
+            await asyncio.sleep(0.01)
+            if self.animated:
+                if time.perf_counter() - max(start, self.last_output) > settle:
+                    break
+            elif not self.busy and time.perf_counter() - max(start, self.last_message) > settle:
+                break
+        else:
+            self.animated = True
+        return {output_id: seconds - start for output_id, seconds in self.recalculated.items()}, self.bytes
+
+
+async def sweep(app, repeat):
+    parser = parse_ui(app)
+    init = initial_message(parser)
+
+    samples = {}
+    sent = {}
+    for input_id, values in parser.choices.items():
+        # A new session for every input, an error in an effect ends the session and would stop all later sweeps
+        client = Client(app)
+        task = asyncio.create_task(client.session._run())
+        await client.send("init", init)
+
+        current = init[input_id]
+        for _ in range(repeat):
+            for value in values + [init[input_id]]:
+                if value == current:
+                    continue
+                latencies, sent_bytes = await client.send("update", {input_id: value})
+                sent.setdefault(input_id, []).append(sent_bytes)
+                # Widgets patched by effects send data without recalculating an output, the input is still reported
+                samples.setdefault(input_id, {})
+                for output_id, seconds in latencies.items():
+                    samples.setdefault(input_id, {}).setdefault(output_id, []).append(seconds)
+                current = value
+
+        client.connection.cause_disconnect()
+        await asyncio.sleep(0.05)
+        task.cancel()
+    return samples, sent
+
+
+def profile_app(app_path, repeat):
+    """Runs in the child process, returns p50/p95 in seconds per input and output, and the median bytes per input."""
+    app_path = Path(app_path).resolve()
+    sys.path.insert(0, str(app_path.parent))
+    os.chdir(app_path.parent)
+
+    samples, sent = asyncio.run(sweep(load_app(app_path), repeat))
+    latency = {input_id: {output_id: {"p50": percentile(values, 50), "p95": percentile(values, 95), "n": len(values)}
+                          for output_id, values in outputs.items()}
+               for input_id, outputs in samples.items()}
+    return {"latency": latency, "bytes": {input_id: percentile(values, 50) for input_id, values in sent.items()}}
+
+
+def run_child(app_path, repeat):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])))
+    process = subprocess.run([sys.executable, __file__, "--child", str(app_path), "--repeat", str(repeat)],
+                             capture_output=True, text=True, env=env)
+    lines = process.stdout.strip().splitlines()
+    if process.returncode != 0 or not lines:
+        error = process.stderr.strip().splitlines()
+        return {"error": error[-1] if error else f"exit code {process.returncode}"}
+    return json.loads(lines[-1])
+
+
+def regressions(report, baseline, tolerance, floor):
+    """Outputs whose p50 grew by more than the tolerance factor (and more than floor seconds) over the baseline."""
+    found = []
+    for app, inputs in report["apps"].items():
+        if "error" in inputs:
+            continue
+        for input_id, outputs in inputs.items():
+            for output_id, latency in outputs.items():
+                before = baseline["apps"].get(app, {}).get(input_id, {}).get(output_id)
+                if before and latency["p50"] > max(tolerance * before["p50"], before["p50"] + floor):
+                    found.append((app, input_id, output_id, before["p50"], latency["p50"]))
+    return found
+
+
+def markdown_report(report):
+    lines = [f"Render latency in ms per input change, {report['repeat']} sweeps per input, "
+             f"Python {report['python']}. Slowest first.", "",
+             "| app | input | output | p50 | p95 | n | kB sent |", "|---|---|---|---:|---:|---:|---:|"]
+    rows = []
+    for app, inputs in report["apps"].items():
+        if "error" in inputs:
+            lines.append(f"| {app} | | | | | | {inputs['error']} |")
+            continue
+        for input_id, outputs in inputs.items():
+            sent = report["bytes"].get(app, {}).get(input_id)
+            if not outputs and sent is not None:
+                rows.append((0, f"| {app} | {input_id} | | | | | {sent / 1e3:.1f} |"))
+            for output_id, latency in outputs.items():
+                rows.append((latency["p95"], f"| {app} | {input_id} | {output_id} | {1e3 * latency['p50']:.0f} | "
+                                             f"{1e3 * latency['p95']:.0f} | {latency['n']} | "
+                                             f"{'' if sent is None else f'{sent / 1e3:.1f}'} |"))
+    lines += [row for _, row in sorted(rows, reverse=True)]
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arguments.add_argument("--repeat", type=int, default=5, help="sweeps over the values of every input")
+    arguments.add_argument("--app", action="append", help="only apps whose path contains this, can be repeated")
+    arguments.add_argument("--output", default="benchmarks/reports/render_latency",
+                           help="path of the report without suffix, .json and .md are written")
+    arguments.add_argument("--baseline", help="earlier .json report to compare the p50 latencies with")
+    arguments.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown factor against the baseline")
+    arguments.add_argument("--floor", type=float, default=0.01, help="slowdowns below this many seconds are ignored")
+    arguments.add_argument("--child", help=argparse.SUPPRESS)
+    args = arguments.parse_args()
+
+    if args.child:
+        print(json.dumps(profile_app(args.child, args.repeat)))
+        sys.exit()
+
+    # Read the baseline first, it may be the report that is about to be overwritten
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+
+    report = {"python": sys.version.split()[0], "repeat": args.repeat, "apps": {}, "bytes": {}}
+    for app_path in discover_apps():
+        name = app_path.parent.relative_to("docs").as_posix()
+        if args.app and not any(part in name for part in args.app):
+            continue
+        result = run_child(app_path, args.repeat)
+        report["apps"][name] = result.get("latency", result)
+        if "bytes" in result:
+            report["bytes"][name] = result["bytes"]
+        print(f"{name}: {len(report['apps'][name])} inputs")
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.with_suffix(".json").write_text(json.dumps(report, indent=2))
+    output.with_suffix(".md").write_text(markdown_report(report))
+    print(markdown_report(report))
+
+    if baseline:
+        found = regressions(report, baseline, args.tolerance, args.floor)
+        for app, input_id, output_id, before, after in found:
+            print(f"Slower: {app} {input_id} -> {output_id}: {1e3 * before:.0f} ms -> {1e3 * after:.0f} ms")
+        sys.exit(1 if found else 0)
@@ -1,7 +1,35 @@
+from pathlib import Path
+import time
 import numpy as np
 import matplotlib.pyplot as plt
-import re
+from htmltools import HTMLDependency
 from shiny import App, Inputs, Outputs, Session, render, ui, reactive
+from teaching import expressions, series
+from teaching.lazy import lazy_import
+
+# plotly is only needed for the animation in the browser
+go = lazy_import("plotly.graph_objects")
+plotly_subplots = lazy_import("plotly.subplots")
+plotly_offline = lazy_import("plotly.offline")
+
+order_min, order_max, order_step = 0, 4, 0.1
+# Every order the slider (and its animation) can select
+orders = np.round(np.arange(order_min, order_max + order_step / 2, order_step), 10)
+sweep_points = 400  # Samples per frame of the animation in the browser
+
+xrange = 10  # Fixed x-range for plotting
+max_factor = 10  # Largest oversampling factor, the function is transformed on up to ±max_factor * xrange
+dx = 2 * xrange * max_factor / 2**14
+# Oversampling factors the adaptive domain chooses from, and how small f has to be at its edges
+factors = [1.2, 1.5, 2, 3, 5, 10]
+decay_tolerance = 1e-6
+# Definitions of the fractional derivative, and how each treats the function outside the visible range
+engines = {"fourier": "Fourier (periodic)", "grunwald": "Grünwald–Letnikov", "caputo": "Caputo"}
+engine_captions = {
+    "fourier": "(ik)^order in Fourier space, f continued periodically beyond the domain",
+    "grunwald": "Grünwald–Letnikov, lower terminal at the left edge of the domain",
+    "caputo": "Caputo, lower terminal a = {terminal:.2f}",
+}
 
 app_ui = ui.page_sidebar(
     ui.sidebar(
@@ -15,63 +43,222 @@ app_ui = ui.page_sidebar(
         ui.input_slider(
             "order",
             "Derivative order",
-            min=0,
-            max=4,
+            min=order_min,
+            max=order_max,
             value=1,
-            step=0.1,
+            step=order_step,
             animate=True
         ),
+        ui.input_select(
+            "engine",
+            "Definition",
+            engines,
+        ),
+        ui.panel_conditional(
+            "input.engine === 'caputo'",
+            ui.input_slider("terminal", "Lower terminal a", min=-xrange, max=0, value=-5, step=0.5),
+        ),
+        ui.input_select(
+            "domain",
+            "Domain",
+            {"fixed": f"Fixed (±{xrange * max_factor})", "adaptive": "Adapted to the decay of f"},
+        ),
+        ui.panel_conditional(
+            "input.engine === 'fourier'",
+            ui.input_select(
+                "window",
+                "Window",
+                {"none": "None", "cosine": "Cosine taper", "blackman": "Blackman taper"},
+            ),
+            ui.input_select(
+                "padding",
+                "Zero padding",
+                {"fast": "To a fast FFT length", "double": "To twice the length", "none": "None"},
+            ),
+        ),
+        ui.output_text("spectral_report"),
         ui.input_dark_mode(id='dark_mode'),
         open='always'
     ),
-    ui.output_plot("plot", width="100%", height="800px"),
+    ui.navset_tab(
+        ui.nav_panel("Plot", ui.output_plot("plot", width="100%", height="800px")),
+        # All orders at once, the animation then runs in the browser
+        ui.nav_panel("Animation", ui.output_ui("sweep")),
+    ),
 )
 
 
-def server(input: Inputs, output: Outputs, session: Session):
-    xrange = 10  # Fixed x-range for plotting
-    factor = 10  # Oversampling factor for better accuracy
-    npix_real = int(2**14) + 1
+def fft_length(n):
+    """Smallest length >= n with no prime factors but 2, 3 and 5, for which the FFT is fast."""
+    best = None
+    power_5 = 1
+    while power_5 < 2 * n:
+        power_35 = power_5
+        while power_35 < 2 * n:
+            length = power_35
+            while length < n:
+                length *= 2
+            best = length if best is None else min(best, length)
+            power_35 *= 3
+        power_5 *= 5
+    return best
+
+
+def adaptive_factor(f, tolerance=decay_tolerance):
+    """Smallest oversampling factor for which |f| stays below tolerance times its visible maximum beyond 90% of the
+    domain, judged on a coarse grid. The periodic copies of f then barely overlap."""
+    x = np.linspace(-xrange * max_factor, xrange * max_factor, 2001)
+    with np.errstate(all="ignore"):
+        y = np.abs(np.real(f(x)))
+    scale = np.nanmax(y[np.abs(x) <= xrange], initial=0)
+    for factor in factors:
+        outside = y[np.abs(x) >= 0.9 * factor * xrange]
+        if np.all(np.isfinite(outside)) and np.max(outside) <= tolerance * scale:
+            return factor
+    return max_factor
+
+
+def window(x, name, factor):
+    """Apodisation, 1 on the visible range and tapering to 0 at the edges of the domain."""
+    if name == "none":
+        return 1
+    t = np.clip((np.abs(x) - xrange) / ((factor - 1) * xrange), 0, 1)
+    if name == "cosine":
+        return 0.5 * (1 + np.cos(np.pi * t))
+    return 0.42 + 0.5 * np.cos(np.pi * t) + 0.08 * np.cos(2 * np.pi * t)  # Blackman
+
+
+def wrap_error(x, y_deriv):
+    """Estimate of the wrap-around error relative to the visible maximum: the derivative at the domain edges, where
+    the periodic copies of the domain meet."""
+    edges = np.abs(y_deriv[np.abs(x) >= 0.95 * np.max(x)])
+    return np.max(edges) / np.max(np.abs(y_deriv[np.abs(x) <= xrange]))
+
+
+def padded_length(n, padding):
+    return {"fast": fft_length(n), "double": fft_length(2 * n), "none": n}[padding]
+
+
+def spectrum(y, dx, padding="fast"):
+    """Spectrum of the real function y, zero-padded, and log(ik) of its frequencies.
+
+    Both only depend on the function, every order then takes one exponential, one product and one inverse FFT.
+    padding is "fast" (to the next fast FFT length), "double" (to twice the length, which keeps the periodic copies of
+    the domain apart) or "none".
+    """
+    n_fft = padded_length(len(y), padding)
+    k = 2 * np.pi * np.fft.rfftfreq(n_fft, d=dx)  # Angular frequency
+    with np.errstate(divide="ignore"):
+        log_ik = np.log(1j * k)
+    return np.fft.rfft(np.real(y), n_fft), log_ik, n_fft
+
+
+def fractional_derivatives(spectrum, orders, size):
+    """Fourier derivatives (ik)^order of the function for an array of orders, one row of size samples per order."""
+    Y, log_ik, n_fft = spectrum
+    orders = np.asarray(orders, dtype=float)
+    with np.errstate(invalid="ignore"):
+        multiplier = np.exp(orders[..., None] * log_ik)
+    multiplier[..., 0] = orders == 0  # (ik)^0 is 1 also at k = 0
+    return np.fft.irfft(Y * multiplier, n_fft, axis=-1)[..., :size]
 
+
+def grunwald_letnikov(y, dx, orders):
+    """Grünwald–Letnikov derivatives with the lower terminal at the first sample, one row per order.
+
+    The weights w_j = (-1)^j binom(order, j) follow from w_j = w_(j-1) (1 - (order + 1) / j), and the sums over all
+    earlier samples are a single FFT convolution for all orders. The error is first order in dx.
+    """
+    orders = np.asarray(orders, dtype=float)
+    weights = np.ones((len(orders), len(y)))
+    weights[:, 1:] = np.cumprod(1 - (orders[:, None] + 1) / np.arange(1, len(y)), axis=1)
+    n_fft = fft_length(2 * len(y) - 1)  # No wrap-around, the convolution is linear
+    sums = np.fft.irfft(np.fft.rfft(weights, n_fft) * np.fft.rfft(np.real(y), n_fft), n_fft)[:, :len(y)]
+    return sums / dx ** orders[:, None]
+
+
+def caputo(x, y, dx, orders, terminal, coefficients):
+    """Caputo derivatives with lower terminal a (snapped to the grid), nan left of it, one row per order.
+
+    The Caputo derivative is the Riemann–Liouville one, here Grünwald–Letnikov, of f minus its Taylor polynomial at a
+    of degree ceil(order) - 1. coefficients are the Taylor coefficients of f at x[np.searchsorted(x, terminal)].
+    """
+    orders = np.asarray(orders, dtype=float)
+    start = np.searchsorted(x, terminal)
+    y_derivs = np.full((len(orders), len(x)), np.nan)
+    for m in np.unique(np.ceil(orders)).astype(int):
+        selected = np.ceil(orders) == m
+        taylor = np.polyval(coefficients[:m][::-1], x[start:] - x[start]) if m else 0
+        y_derivs[selected, start:] = grunwald_letnikov(y[start:] - taylor, dx, orders[selected])
+    return y_derivs
+
+
+def plotly_dependency():
+    """plotly.js as shipped with the plotly package. The browser loads it once, however often the animation is rendered."""
+    return HTMLDependency(
+        "plotly",
+        plotly_offline.get_plotlyjs_version(),
+        source={"subdir": str(Path(plotly_offline.__file__).parents[1] / "package_data")},
+        script={"src": "plotly.min.js"},
+    )
+
+
+def server(input: Inputs, output: Outputs, session: Session):
     @reactive.calc
-    def clean_function():
-        """Clean and validate the input function"""
-        func_str = input.function().strip()
-
-        # Replace common mathematical functions with numpy equivalents
-        replacements = {
-            r'\b(sin)\b': 'np.sin',
-            r'\b(cos)\b': 'np.cos',
-            r'\b(tan)\b': 'np.tan',
-            r'\b(exp)\b': 'np.exp',
-            r'\b(log)\b': 'np.log',
-            r'\b(sqrt)\b': 'np.sqrt',
-            r'\b(abs)\b': 'np.abs',
-            r'\^': '**',  # escaped caret for literal match
-        }
-
-        # Apply all replacements
-        for pattern, replacement in replacements.items():
-            func_str = re.sub(pattern, replacement, func_str)
-
-        return func_str
+    def compiled_function():
+        """The input function compiled once"""
+        try:
+            return expressions.compile_expression(input.function(), "x")
+        except ValueError as e:
+            ui.notification_show(f"{e}. Using default e**(-x**2).", duration=10, type="error")
+            return expressions.compile_expression("e**(-x**2)", "x")
 
     @reactive.calc
     def evaluate_function():
         """Evaluate the function at given x values"""
-        func_str = clean_function()
+        f = compiled_function()
 
-        x = np.linspace(-xrange*factor, xrange*factor, npix_real)
+        # Same spacing for every domain, only the number of samples changes
+        factor = adaptive_factor(f) if input.domain() == "adaptive" else max_factor
+        x = dx * np.arange(-round(xrange * factor / dx), round(xrange * factor / dx) + 1)
         try:
-            # Create a safe namespace for evaluation
-            namespace = {'x': x, 'np': np, 'pi': np.pi, 'e': np.e}
-            y = eval(func_str, {"__builtins__": {}}, namespace)
-            return x, y, func_str
+            return x, f(x), f.formula
         except Exception as e:
             # Return a default function if evaluation fails
-            ui.notification_show(f"Error evaluating function: {func_str}. Using default e**(-x**2).", duration=10, type="error")
+            ui.notification_show(f"Error evaluating function: {f.formula}. Using default e**(-x**2).", duration=10, type="error")
             return x, np.exp(-x**2), "e**(-x**2)"
 
+    @reactive.calc
+    def timed_derivatives():
+        """Derivatives of all orders of the slider with the selected definition, and the time taken"""
+        x, y_true, func_str = evaluate_function()
+        start = time.perf_counter()
+        if input.engine() == "grunwald":
+            y_derivs = grunwald_letnikov(y_true, dx, orders)
+        elif input.engine() == "caputo":
+            a = x[np.searchsorted(x, input.terminal())]
+            max_degree = int(np.ceil(order_max)) - 1
+            y_derivs = caputo(x, y_true, dx, orders, a, series.taylor_coefficients(func_str, "x", float(a), max_degree))
+        else:
+            # The spectrum is computed once per function
+            y = y_true * window(x, input.window(), np.max(x) / xrange)
+            y_derivs = fractional_derivatives(spectrum(y, dx, input.padding()), orders, len(x))
+        return y_derivs, time.perf_counter() - start
+
+    def derivatives():
+        return timed_derivatives()[0]
+
+    @render.text
+    def spectral_report():
+        x, y_true, func_str = evaluate_function()
+        y_derivs, seconds = timed_derivatives()
+        report = f"Domain ±{np.max(x):.0f}, {1e3 * seconds:.1f} ms for all {len(orders)} orders"
+        if input.engine() != "fourier":
+            return report
+        with np.errstate(all="ignore"):
+            error = wrap_error(x, y_derivs[np.argmin(np.abs(orders - input.order()))])
+        n_fft = padded_length(len(x), input.padding())
+        return f"{report}, FFT length {n_fft}, estimated wrap-around error {error:.1e}"
 
     @render.plot()
     def plot():
@@ -89,12 +276,12 @@ def server(input: Inputs, output: Outputs, session: Session):
             # Plot original function
             ax[0].plot(x, y_true, linewidth=2, label=r'$f(x)$')
 
-            # Compute non-integer derivative using Fourier transform method
-            Y = np.fft.fft(y_true)
-            k = np.fft.fftfreq(len(x), d=(x[1]-x[0])) * 2 * np.pi  # Angular frequency
-
-            Y_deriv = Y * ((1j * k) ** order)
-            y_deriv = np.real(np.fft.ifft(Y_deriv))
+            # Non-integer derivative with the selected definition, precomputed for every order of the slider
+            y_deriv = derivatives()[np.argmin(np.abs(orders - order))]
+            caption = engine_captions[input.engine()]
+            if input.engine() == "caputo":
+                caption = caption.format(terminal=x[np.searchsorted(x, input.terminal())])
+            ax[1].set_title(caption)
 
             # Plot derivative
             ax[1].plot([0], [0])  # Dummy plot to ensure proper scaling
@@ -111,8 +298,8 @@ def server(input: Inputs, output: Outputs, session: Session):
             y_range = y_max - y_min
             ax[0].set_ylim(y_min - 0.1 * y_range, y_max + 0.1 * y_range)
 
-            y_min = np.min(y_deriv[np.abs(x)<=xrange])
-            y_max = np.max(y_deriv[np.abs(x)<=xrange])
+            y_min = np.nanmin(y_deriv[np.abs(x)<=xrange])
+            y_max = np.nanmax(y_deriv[np.abs(x)<=xrange])
             y_range = y_max - y_min
             ax[1].set_ylim(y_min - 0.1 * y_range, y_max + 0.1 * y_range)
 
@@ -120,6 +307,55 @@ def server(input: Inputs, output: Outputs, session: Session):
             ax[1].set_xlim(-xrange, xrange)
         return fig
 
+    @render.ui
+    def sweep():
+        """All orders as Plotly frames, sent once and played back in the browser without the server"""
+        x, y_true, func_str = evaluate_function()
+        with reactive.isolate():
+            start = int(np.argmin(np.abs(orders - input.order())))
+
+        # Only the visible range, and at most about sweep_points samples of it; float32 is sent as a binary buffer
+        visible = np.flatnonzero(np.abs(x) <= xrange)
+        visible = visible[::max(1, len(visible) // sweep_points)]
+        x_visible = x[visible].astype(np.float32)
+        y_visible = y_true[visible].astype(np.float32)
+        y_derivs = derivatives()[:, visible].astype(np.float32)
+
+        def y_range(y):
+            y_min, y_max = float(np.nanmin(y)), float(np.nanmax(y))
+            return [y_min - 0.1 * (y_max - y_min), y_max + 0.1 * (y_max - y_min)]
+
+        fig = plotly_subplots.make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.05)
+        fig.add_trace(go.Scatter(x=x_visible, y=y_visible, name='f(x)'), row=1, col=1)
+        fig.add_trace(go.Scatter(x=x_visible, y=y_derivs[start], name='derivative'), row=2, col=1)
+        fig.frames = [
+            go.Frame(data=[go.Scatter(y=y_deriv)], traces=[1], name=f'{order:g}',
+                     layout=dict(yaxis2=dict(range=y_range(y_deriv))))
+            for order, y_deriv in zip(orders, y_derivs)
+        ]
+
+        step_args = dict(mode='immediate', frame=dict(duration=0, redraw=False), transition=dict(duration=0))
+        fig.update_layout(
+            template="plotly_dark" if input.dark_mode() == "dark" else "plotly_white",
+            height=800,
+            margin=dict(l=0, r=0, t=0, b=0),
+            showlegend=False,
+            xaxis2=dict(title='x', range=[-xrange, xrange]),
+            yaxis=dict(title='f(x)', range=y_range(y_visible)),
+            yaxis2=dict(title='derivative', range=y_range(y_derivs[start])),
+            updatemenus=[dict(type='buttons', x=0, y=-0.08, xanchor='left', yanchor='top', direction='left',
+                              buttons=[dict(label='Play', method='animate',
+                                            args=[None, dict(step_args, frame=dict(duration=100, redraw=False),
+                                                             fromcurrent=True)]),
+                                       dict(label='Pause', method='animate', args=[[None], step_args])])],
+            sliders=[dict(active=start, x=0.15, len=0.85, y=-0.05, currentvalue=dict(prefix='Order: '),
+                          steps=[dict(label=f'{order:g}', method='animate', args=[[f'{order:g}'], step_args])
+                                 for order in orders])],
+        )
+        # Only the figure and its frames are sent on every change, plotly.js comes with the dependency
+        return ui.TagList(plotly_dependency(), ui.HTML(fig.to_html(include_plotlyjs=False, full_html=False,
+                                                                   auto_play=False)))
+
 
 app = App(app_ui, server)
 
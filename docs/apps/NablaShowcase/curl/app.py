@@ -1,7 +1,8 @@
 import numpy as np
 import plotly.graph_objects as go
-import re
-from shiny import App, Inputs, Outputs, Session, render, ui, reactive
+from shiny import App, Inputs, Outputs, Session, ui, reactive
+from shinywidgets import output_widget, render_plotly
+from teaching import expressions
 
 app_ui = ui.page_sidebar(
     ui.sidebar(
@@ -29,7 +30,7 @@ app_ui = ui.page_sidebar(
         ui.input_checkbox('show_curl', 'Show Curl', value=True),
         ui.input_dark_mode(id='dark_mode'),
     ),
-    ui.output_ui("plot")
+    output_widget("plot")
 )
 
 
@@ -43,110 +44,104 @@ def server(input: Inputs, output: Outputs, session: Session):
     # z = np.zeros_like(x)
 
     @reactive.calc
-    def clean_function():
-        """Clean and validate the input function"""
-        func_strings = []
-        # Replace common mathematical functions with numpy equivalents
-        replacements = {
-            r'\b(sin)\b': 'np.sin',
-            r'\b(cos)\b': 'np.cos',
-            r'\b(tan)\b': 'np.tan',
-            r'\b(exp)\b': 'np.exp',
-            r'\b(log)\b': 'np.log',
-            r'\b(sqrt)\b': 'np.sqrt',
-            r'\b(abs)\b': 'np.abs',
-            r'\^': '**',  # escaped caret for literal match
-        }
-
-        for func_str in [input.function_x().strip(),
-                         input.function_y().strip(),
-                         input.function_z().strip()]:
-
-           # Apply all replacements
-            for pattern, replacement in replacements.items():
-                func_str = re.sub(pattern, replacement, func_str)
-
-            func_strings.append(func_str)
-        return func_strings
+    def compiled_functions():
+        """The input functions compiled once, None for invalid ones"""
+        functions = []
+        for func_str in [input.function_x(), input.function_y(), input.function_z()]:
+            try:
+                functions.append(expressions.compile_expression(func_str, "x", "y", "z"))
+            except ValueError as e:
+                ui.notification_show(f"{e}.", duration=10, type="error")
+                functions.append(None)
+        return functions
 
     @reactive.calc
     def evaluate_function():
         """Evaluate the function at given x values"""
-        func_strings = clean_function()
-
         results = []
-        ones = np.ones_like(x) # force correct output dimension
-        for func_str in func_strings:
+        for f in compiled_functions():
             try:
-                # Create a safe namespace for evaluation
-                namespace = {'x': x, 'y': y, 'z': z, 'np': np, 'pi': np.pi, 'e': np.e}
-                f = eval(func_str, {"__builtins__": {}}, namespace)
-                results.append(ones * f)
+                results.append(f(x, y, z) if f else np.zeros_like(x))
             except Exception as e:
                 # Return a default function if evaluation fails
-                ui.notification_show(f"Error evaluating function: {func_str}.", duration=10,
+                ui.notification_show(f"Error evaluating function: {f.formula}.", duration=10,
                                      type="error")
-                results.append(ones * 0)
+                results.append(np.zeros_like(x))
         return results
 
-    @render.ui
-    def plot():
-        # Set template based on dark mode
-        if input.dark_mode() == "dark":
-            template = "plotly_dark"
-        else:
-            template = "plotly_white"
-
+    @reactive.calc
+    def vectors():
+        """Components of the field and of its curl, flattened for the cones"""
         fx, fy, fz = evaluate_function()
+        curl_x, curl_y, curl_z = get_curl(x, y, z, fx, fy, fz)
+        # 1D float32 arrays are sent to the widget as binary buffers of half the size
+        return [dict(u=u.flatten().astype(np.float32), v=v.flatten().astype(np.float32), w=w.flatten().astype(np.float32))
+                for u, v, w in [(fx, fy, fz), (curl_x, curl_y, curl_z)]]
 
-        # Create 3D surface plot
-        fig = go.Figure()
+    def template():
+        if input.dark_mode() == "dark":
+            return "plotly_dark"
+        return "plotly_white"
 
-        if input.show_curl():
-            curl_x, curl_y, curl_z = get_curl(x, y, z, fx, fy, fz)
-            fig.add_trace(
-                go.Cone(
-                    x=x.flatten(),
-                    y=y.flatten(),
-                    z=z.flatten(),
-                    u=curl_x.flatten(),
-                    v=curl_y.flatten(),
-                    w=curl_z.flatten(),
-                    sizemode="raw",
-                    anchor="tail",
-                    hoverinfo='skip',
-                )
-            )
-        else:
-            fig.add_trace(
+    # The figure is built once with a trace for the field and one for the curl, the effects below only patch the
+    # vectors, the visible trace and the theme of the widget. Until it has been rendered, reading plot.widget cancels
+    # the effects silently, they run again once it exists
+    @render_plotly
+    def plot():
+        with reactive.isolate():
+            field, curl = vectors()
+            fig = go.Figure(data=[
                 go.Cone(
                     x=x.flatten(),
                     y=y.flatten(),
                     z=z.flatten(),
-                    u=fx.flatten(),
-                    v=fy.flatten(),
-                    w=fz.flatten(),
+                    **components,
                     sizemode="raw",
                     anchor="tail",
                     hoverinfo='skip',
+                    visible=visible,
                 )
+                for components, visible in [(field, not input.show_curl()), (curl, input.show_curl())]
+            ])
+
+            fig.update_layout(
+                template=template(),
+                scene=dict(
+                    xaxis_title='X-axis',
+                    yaxis_title='Y-axis',
+                    zaxis_title='Z-axis',
+                    xaxis_showspikes=False,
+                    yaxis_showspikes=False,
+                    zaxis_showspikes=False,
+                ),
+                height=700,
+                margin=dict(l=0, r=0, t=0, b=0),
             )
 
-        fig.update_layout(
-            template=template,
-            scene=dict(
-                xaxis_title='X-axis',
-                yaxis_title='Y-axis',
-                zaxis_title='Z-axis',
-                xaxis_showspikes=False,
-                yaxis_showspikes=False,
-                zaxis_showspikes=False,
-            ),
-            height=700,
-            margin=dict(l=0, r=0, t=0, b=0),
-        )
-
-        return ui.HTML(fig.to_html())
+        return fig
+
+    @reactive.effect
+    def update_vectors():
+        field, curl = vectors()
+        widget = plot.widget
+        with widget.batch_update():
+            widget.data[0].update(**field)
+            widget.data[1].update(**curl)
+
+    @reactive.effect
+    def update_visible_trace():
+        show_curl = input.show_curl()
+        widget = plot.widget
+        with widget.batch_update():
+            widget.data[0].visible = not show_curl
+            widget.data[1].visible = show_curl
+
+    @reactive.effect
+    def update_template():
+        layout_template = template()
+        widget = plot.widget
+        widget.update_layout(template=layout_template)
+
 
 def get_curl(x,y,z,u,v,w):
     dx = x[0,:,0]
@@ -1,7 +1,22 @@
+import math
 import numpy as np
 import plotly.graph_objects as go
-import re
-from shiny import App, Inputs, Outputs, Session, render, ui, reactive
+from shiny import App, Inputs, Outputs, Session, ui, reactive
+from shinywidgets import output_widget, render_plotly
+from teaching import expressions, series
+
+# Cones are drawn on a subset of the grid, at most target_cones of them and at least min_cone_spacing pixels apart
+target_cones = 2500
+min_cone_spacing = 12
+
+
+def cone_stride(num_pix, width):
+    """Step between the grid points that get a cone, for a num_pix by num_pix grid in a plot width pixels wide"""
+    stride = math.ceil(num_pix / math.sqrt(target_cones))
+    if width:
+        stride = max(stride, math.ceil(num_pix * min_cone_spacing / width))
+    return max(stride, 1)
+
 
 app_ui = ui.page_sidebar(
     ui.sidebar(
@@ -16,7 +31,7 @@ app_ui = ui.page_sidebar(
         ui.input_checkbox('align_gradient', 'Align Gradient', value=True),
         ui.input_dark_mode(id='dark_mode'),
     ),
-    ui.output_ui("plot")
+    output_widget("plot")
 )
 
 
@@ -28,99 +43,121 @@ def server(input: Inputs, output: Outputs, session: Session):
     x, y = np.meshgrid(x_axis, y_axis)
 
     @reactive.calc
-    def clean_function():
-        """Clean and validate the input function"""
-        func_str = input.function().strip()
-
-        # Replace common mathematical functions with numpy equivalents
-        replacements = {
-            r'\b(sin)\b': 'np.sin',
-            r'\b(cos)\b': 'np.cos',
-            r'\b(tan)\b': 'np.tan',
-            r'\b(exp)\b': 'np.exp',
-            r'\b(log)\b': 'np.log',
-            r'\b(sqrt)\b': 'np.sqrt',
-            r'\b(abs)\b': 'np.abs',
-            r'\^': '**',  # escaped caret for literal match
-        }
-
-        # Apply all replacements
-        for pattern, replacement in replacements.items():
-            func_str = re.sub(pattern, replacement, func_str)
-
-        return func_str
+    def compiled_function():
+        """The input function compiled once"""
+        try:
+            return expressions.compile_expression(input.function(), "x", "y")
+        except ValueError as e:
+            ui.notification_show(f"{e}. Using default e**(-x**2 - y**2) * sin(x).", duration=10, type="error")
+            return expressions.compile_expression("e**(-x**2 - y**2) * sin(x)", "x", "y")
 
     @reactive.calc
     def evaluate_function():
         """Evaluate the function at given x values"""
-        func_str = clean_function()
+        f = compiled_function()
         try:
-            # Create a safe namespace for evaluation
-            namespace = {'x': x, 'y': y, 'np': np, 'pi': np.pi, 'e': np.e}
-            f = eval(func_str, {"__builtins__": {}}, namespace)
-            return f, func_str
+            return f(x, y), f.formula
         except Exception as e:
             # Return a default function if evaluation fails
-            ui.notification_show(f"Error evaluating function: {func_str}. Using default e**(-x**2).", duration=10,
+            ui.notification_show(f"Error evaluating function: {f.formula}. Using default e**(-x**2).", duration=10,
                                  type="error")
             return np.e**(-x**2 - y**2) * np.sin(x), "e**(-x**2 - y**2) * sin(x)"
 
-    @render.ui
-    def plot():
+    @reactive.calc
+    def gradient():
+        """Exact gradient of the shown function, in units of the axes"""
         f, func_str = evaluate_function()
+        return series.gradient(func_str, ("x", "y"), x, y)
 
-        gradient = np.gradient(f)
+    @reactive.calc
+    def stride():
+        return cone_stride(num_pix, session.clientdata.output_width("plot"))
 
+    @reactive.calc
+    def cone_data():
+        """Cones on every stride-th point of the grid, on the surface and tilted along it if aligned"""
+        f, func_str = evaluate_function()
+        gradient_x, gradient_y = gradient()
+        skip = (slice(None, None, stride()), slice(None, None, stride()))
+        cones = dict(x=x[skip], y=y[skip], u=gradient_x[skip], v=gradient_y[skip])
+        if input.align_gradient():
+            cones.update(z=f[skip], w=np.hypot(gradient_x, gradient_y)[skip])
+        else:
+            cones.update(z=np.zeros_like(cones["u"]), w=np.zeros_like(cones["u"]))
+        # Points where the function or its gradient is not defined get no cone
+        keep = np.all([np.isfinite(value) for value in cones.values()], axis=0)
+        # 1D float32 arrays are sent to the widget as binary buffers of half the size
+        return {key: value[keep].astype(np.float32) for key, value in cones.items()}
 
-        # Set template based on dark mode
+    def template():
         if input.dark_mode() == "dark":
-            template = "plotly_dark"
-        else:
-            template = "plotly_white"
-
-
-        skip = (slice(None, None, 1), slice(None, None, 1))  # Skip some points for clarity
-        # Create 3D surface plot
-        fig = go.Figure(data=[
-            go.Cone(
-                x=x[skip].flatten(),
-                y=y[skip].flatten(),
-                z=f[skip].flatten() if input.align_gradient() else np.zeros_like(f[skip].flatten()),
-                u=gradient[1][skip].flatten(),
-                v=gradient[0][skip].flatten(),
-                w=np.sqrt(gradient[0][skip].flatten() ** 2 + gradient[1][skip].flatten() ** 2) if input.align_gradient() else np.zeros_like(gradient[0][skip].flatten()),
-                sizemode="raw",
-                anchor="tail",
-                hoverinfo='skip',
+            return "plotly_dark"
+        return "plotly_white"
+
+    # The figure is built once, the effects below only patch the data, the visible trace and the theme of the widget
+    # Until it has been rendered, reading plot.widget cancels the effects silently, they run again once it exists
+    @render_plotly
+    def plot():
+        with reactive.isolate():
+            f, func_str = evaluate_function()
+            fig = go.Figure(data=[
+                go.Cone(
+                    **cone_data(),
+                    # The longest cone spans about half the distance between cones, whatever the stride
+                    sizemode="scaled",
+                    anchor="tail",
+                    hoverinfo='skip',
+                    visible=input.show_gradient(),
+                ),
+                go.Surface(
+                    x=x,
+                    y=y,
+                    z=f,
+                    colorscale='turbo',
+                    colorbar_title_text='f(x,y)',
+                    showscale=True,
+                    hoverinfo='skip',
+                    visible=not input.show_gradient(),
+                ),
+            ])
+
+            fig.update_layout(
+                template=template(),
+                scene=dict(
+                    xaxis_title='X-axis',
+                    yaxis_title='Y-axis',
+                    zaxis_title='f(x,y)',
+                    xaxis_showspikes=False,
+                    yaxis_showspikes=False,
+                    zaxis_showspikes=False,
+                ),
+                height=700,
+                margin=dict(l=0, r=0, t=0, b=0),
             )
-            if input.show_gradient() else
-            go.Surface(
-                x=x,
-                y=y,
-                z=f,
-                colorscale='turbo',
-                colorbar_title_text='f(x,y)',
-                showscale=True,
-                hoverinfo='skip'
-            ),
-
-        ])
-
-        fig.update_layout(
-            template=template,
-            scene=dict(
-                xaxis_title='X-axis',
-                yaxis_title='Y-axis',
-                zaxis_title='f(x,y)',
-                xaxis_showspikes=False,
-                yaxis_showspikes=False,
-                zaxis_showspikes=False,
-            ),
-            height=700,
-            margin=dict(l=0, r=0, t=0, b=0),
-        )
-
-        return ui.HTML(fig.to_html())
 
+        return fig
+
+    @reactive.effect
+    def update_data():
+        f, func_str = evaluate_function()
+        cones = cone_data()
+        widget = plot.widget
+        with widget.batch_update():
+            widget.data[0].update(**cones)
+            widget.data[1].update(z=f)
+
+    @reactive.effect
+    def update_visible_trace():
+        show_gradient = input.show_gradient()
+        widget = plot.widget
+        with widget.batch_update():
+            widget.data[0].visible = show_gradient
+            widget.data[1].visible = not show_gradient
+
+    @reactive.effect
+    def update_template():
+        layout_template = template()
+        widget = plot.widget
+        widget.update_layout(template=layout_template)
 
 app = App(app_ui, server)
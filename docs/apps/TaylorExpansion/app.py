@@ -1,11 +1,12 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import math
-import re
 from shiny import App, Inputs, Outputs, Session, render, ui, reactive
+from teaching import expressions, series
 
 
 plt.style.use('seaborn-v0_8')
+max_order = 10
+num_centers = 201
 
 app_ui = ui.page_sidebar(
     ui.sidebar(
@@ -16,11 +17,16 @@ app_ui = ui.page_sidebar(
             placeholder="Enter function like: sin(x), cos(x), exp(x), x**2, etc.",
             update_on='blur',
         ),
+        ui.input_radio_buttons(
+            "view",
+            "View",
+            {"expansion": "Expansion", "error_x": "Error over x", "error_center": "Error over centers"},
+        ),
         ui.input_slider(
             "order",
             "Taylor Expansion Order",
             min=0,
-            max=10,
+            max=max_order,
             value=2,
             step=1,
             animate=True
@@ -55,69 +61,84 @@ app_ui = ui.page_sidebar(
 
 def server(input: Inputs, output: Outputs, session: Session):
     @reactive.calc
-    def clean_function():
-        """Clean and validate the input function"""
-        func_str = input.function().strip()
-
-        # Replace common mathematical functions with numpy equivalents
-        replacements = {
-            r'\b(sin)\b': 'np.sin',
-            r'\b(cos)\b': 'np.cos',
-            r'\b(tan)\b': 'np.tan',
-            r'\b(exp)\b': 'np.exp',
-            r'\b(log)\b': 'np.log',
-            r'\b(sqrt)\b': 'np.sqrt',
-            r'\b(abs)\b': 'np.abs',
-            r'\^': '**',  # escaped caret for literal match
-        }
-
-        # Apply all replacements
-        for pattern, replacement in replacements.items():
-            func_str = re.sub(pattern, replacement, func_str)
-
-        return func_str
+    def compiled_function():
+        """The input function compiled once, re-evaluating it for a new range is a plain function call"""
+        try:
+            return expressions.compile_expression(input.function(), "x")
+        except ValueError:
+            return expressions.compile_expression("cos(x)", "x")
 
     @reactive.calc
     def evaluate_function():
         """Evaluate the function at given x values"""
-        func_str = clean_function()
+        f = compiled_function()
         x_range = input.x_range()
         x = np.linspace(-x_range, x_range, 1024 + 1)
 
         try:
-            # Create a safe namespace for evaluation
-            namespace = {'x': x, 'np': np, 'pi': np.pi, 'e': np.e}
-            y = eval(func_str, {"__builtins__": {}}, namespace)
-            return x, y, func_str
+            return x, f(x), f.formula
         except Exception as e:
             # Return a default function if evaluation fails
             return x, np.cos(x), "cos(x)"
 
     @reactive.calc
-    def calculate_derivatives():
-        """Calculate numerical derivatives using numpy gradients"""
-        x, y, func_str = evaluate_function()
-        a = input.center()
+    def calculate_coefficients():
+        """Exact Taylor coefficients f^(n)(a) / n! at the expansion center, up to the highest order"""
+        return series.taylor_coefficients(compiled_function().formula, "x", float(input.center()), max_order)
 
-        # Find the index closest to the expansion center
-        center_idx = np.argmin(np.abs(x - a))
-
-        # Calculate derivatives using numpy gradient
-        derivatives = [y]  # 0th derivative is the function itself
-        current_derivative = y
+    @reactive.calc
+    def calculate_partial_sums():
+        """Terms and partial sums of all orders, changing the order (or animating it) only picks one of them"""
+        x, y, func_str = evaluate_function()
+        return series.partial_sums(calculate_coefficients(), x, float(input.center()))
 
-        # Calculate up to the required order
-        for i in range(input.order()):
-            # Calculate numerical derivative
-            current_derivative = np.gradient(current_derivative, x)
-            derivatives.append(current_derivative)
+    @reactive.calc
+    def convergence_radius():
+        return series.convergence_radius(compiled_function().formula, "x", float(input.center()))
 
-        # Extract derivative values at the expansion center
-        derivative_values = []
-        for deriv in derivatives:
-            derivative_values.append(deriv[center_idx])
+    @reactive.calc
+    def errors_over_centers():
+        """Largest error over the x range of every order, for expansions around centers across the range"""
+        x, y, func_str = evaluate_function()
+        centers = np.linspace(x[0], x[-1], num_centers)
+        return centers, series.taylor_errors(compiled_function().formula, "x", x, centers, max_order,
+                                             reduce=np.fmax.reduce)
 
-        return derivative_values
+    def plot_errors(fig, ax):
+        """Error |f - f_n| as a map over x or the expansion center, and all orders"""
+        x, y_true, func_str = evaluate_function()
+        a = input.center()
+        orders = np.arange(max_order + 1)
+        if input.view() == "error_x":
+            y_taylor_terms, partial_sums = calculate_partial_sums()
+            with np.errstate(all="ignore"):
+                errors = np.abs(np.where(np.isfinite(y_true), y_true, np.nan) - partial_sums)
+            horizontal, label = x, 'x'
+        else:
+            horizontal, errors = errors_over_centers()
+            label = 'Expansion center a (largest error over x)'
+
+        with np.errstate(divide="ignore"):
+            log_errors = np.log10(np.maximum(errors, 1e-16))
+        # Errors beyond 10^6 have diverged, more contrast is more useful at the small ones
+        mesh = ax.pcolormesh(horizontal, orders, log_errors, shading='nearest', cmap='viridis', vmin=-12, vmax=6)
+        fig.colorbar(mesh, ax=ax, extend='both', label=r'$\log_{10}|f(x) - f_n(x)|$')
+        ax.axhline(input.order(), color='white', ls=':', linewidth=1)
+        ax.axvline(a, color='white', ls=':', linewidth=1)
+
+        radius = convergence_radius()
+        if input.view() == "error_x" and np.isfinite(radius):
+            for edge in (a - radius, a + radius):
+                ax.axvline(edge, color='red', ls='--', linewidth=1)
+        if np.isfinite(radius):
+            ax.set_title(rf'Radius of convergence $R \approx {radius:.3g}$, estimated from the coefficients')
+        elif np.isnan(radius):
+            ax.set_title('Radius of convergence could not be estimated from the coefficients')
+        else:
+            ax.set_title(r'Radius of convergence $R = \infty$')
+        ax.set_xlim(horizontal[0], horizontal[-1])
+        ax.set_xlabel(label)
+        ax.set_ylabel('Order n')
 
     @render.plot()
     def taylor_plot():
@@ -127,29 +148,26 @@ def server(input: Inputs, output: Outputs, session: Session):
             style_label = 'seaborn-v0_8'
 
         with plt.style.context(style_label):
+            fig, ax = plt.subplots()
+            if input.view() != "expansion":
+                plot_errors(fig, ax)
+                return fig
+
             x, y_true, func_str = evaluate_function()
             a = input.center()
             order = input.order()
-            derivative_values = calculate_derivatives()
-
-            fig, ax = plt.subplots()
+            coefficients = calculate_coefficients()
+            y_taylor_terms, partial_sums = calculate_partial_sums()
 
             # Plot original function
             ax.plot(x, y_true, linewidth=2, label=r'$f(x)$')
 
-            # Calculate Taylor expansion
-            y_taylor_terms = []
-            for n in range(order + 1):
-                # Add nth term of Taylor series
-                y_taylor_terms.append(derivative_values[n] * ((x - a) ** n) / math.factorial(n))
-            y_taylor = np.sum(y_taylor_terms, axis=0)
-
-            # Plot Taylor approximation
+            # Plot Taylor approximation of the selected order
+            y_taylor = partial_sums[order]
             ax.plot(x, y_taylor, '--', linewidth=2, label=rf'$f_{order}(x)$')
 
             # Mark the point on the original function at expansion center
-            center_idx = np.argmin(np.abs(x - a))
-            temp = ax.plot(a, y_true[center_idx], 'o', markersize=8)
+            temp = ax.plot(a, coefficients[0], 'o', markersize=8)
             ax.axvline(x=a, linestyle=':', color=temp[0].get_color(),
                        label=rf'$a={a:.2f}$')
 
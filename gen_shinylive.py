@@ -1,14 +1,180 @@
 #!/usr/bin/env python
 from pathlib import Path
-from shinylive import _export
+from shinylive import _deps, _export, _utils
+from shinylive import __version__ as shinylive_version
+from shinylive._assets import ensure_shinylive_assets, shinylive_assets_dir
+import ast
+import concurrent.futures
+import hashlib
+import json
+import multiprocessing
 import os
 from pymdownx.slugs import slugify
 import platform
+import re
 import shutil
+import tempfile
+import time
 
 target_url = 'https://physicsapps.github.io/teaching/' #use this for QR-code generation via e.g. https://pypi.org/project/qrcode/
 
+# Content hashes of the exported apps, used to skip apps that did not change since the last build.
+# Note that `mkdocs build` cleans ./site unless it is called with --dirty, in which case everything is exported again.
+manifest_path = Path("./site", "shinylive_manifest.json")
 
+# All apps load the shinylive runtime and the pyodide packages from ./site/shinylive. With shared_assets it is copied
+# once from the local shinylive cache before the apps are exported, and identical files in ./site/shinylive and the
+# exported apps are hard-linked to a single copy afterwards. Nothing else in ./site is linked, as `mkdocs build --dirty`
+# overwrites its files in place, which would change every linked copy. Set to False to let each export copy the runtime
+# as shinylive does by default.
+shared_assets = True
+
+# Package with code shared by the apps, bundled into the export of every app that imports it
+shared_package = Path("teaching")
+
+
+def uses_shared_package(app_dir):
+    pattern = re.compile(rf"^\s*(from|import)\s+{shared_package.name}\b", re.MULTILINE)
+    return any(pattern.search(path.read_text(encoding="utf-8")) for path in Path(app_dir).rglob("*.py"))
+
+
+def source_files(source_dir):
+    return [path for path in sorted(Path(source_dir).rglob("*")) if path.is_file() and "__pycache__" not in path.parts]
+
+
+def hash_app(app_dir):
+    """Hash of all files that end up in the exported app (sources, requirements.txt, ...) and the shinylive version."""
+    digest = hashlib.sha256(shinylive_version.encode())
+    source_dirs = [app_dir, shared_package] if uses_shared_package(app_dir) else [app_dir]
+    for source_dir in source_dirs:
+        for path in source_files(source_dir):
+            digest.update(path.relative_to(Path(source_dir).parent).as_posix().encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def install_runtime():
+    """Put the shinylive runtime and all pyodide packages into ./site/shinylive, returns the number of bytes installed."""
+    assets_dir = Path(shinylive_assets_dir())
+    files = set(_deps.shinylive_common_files(asset_type=("base", "python")))
+    files.update(str(Path("shinylive", "pyodide", file))
+                 for file in _utils.listdir_recursive(assets_dir / "shinylive" / "pyodide"))
+
+    installed = 0
+    for file in sorted(files):
+        dest_path = Path("./site", file)
+        if dest_path.exists():
+            continue
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        # A copy, not a link into the cache, so that nothing written to ./site can change the cache
+        shutil.copy2(assets_dir / file, dest_path)
+        installed += dest_path.stat().st_size
+    return installed
+
+
+def deduplicate(roots):
+    """Replace files with identical content below the roots by hard links to one copy, returns the number of bytes saved.
+
+    Only directories that are never written in place may be passed, writing one of the linked files changes all of them.
+    """
+    by_size = {}
+    for root in roots:
+        for path in sorted(Path(root).rglob("*")):
+            if path.is_file() and not path.is_symlink():
+                by_size.setdefault(path.stat().st_size, []).append(path)
+
+    saved = 0
+    for size, paths in by_size.items():
+        if size == 0 or len(paths) < 2:
+            continue
+        by_hash = {}
+        for path in paths:
+            digest = hashlib.sha256(path.read_bytes()).hexdigest()
+            original = by_hash.setdefault(digest, path)
+            if original is path or os.path.samefile(original, path):
+                continue
+            tmp_path = path.with_name(path.name + ".dedup")
+            os.link(original, tmp_path)
+            os.replace(tmp_path, path)
+            saved += size
+    return saved
+
+
+def normalize_package(name):
+    return name.lower().replace("_", "-")
+
+
+def package_wheels(packages):
+    """Pyodide packages (with dependencies) that are loaded for the given ones, and the bytes of their wheels."""
+    names = _deps._find_recursive_deps(packages)
+    wheels_dir = Path(shinylive_assets_dir(), "shinylive", "pyodide")
+    return {normalize_package(info["name"]): (wheels_dir / info["file_name"]).stat().st_size
+            for info in _deps._dep_names_to_pyodide_pkg_infos(names) if (wheels_dir / info["file_name"]).exists()}
+
+
+def check_packages(app_dir):
+    """Packages the exported app loads on top of the base packages, and the bytes of their wheels.
+
+    Fails if requirements.txt lists packages the app never imports, which would be downloaded for nothing, or if a
+    package imported through teaching.lazy is missing there, as Pyodide would not find it.
+    """
+    imported, lazy = set(), set()
+    for path in Path(app_dir).rglob("*.py"):
+        source = path.read_text(encoding="utf-8")
+        try:
+            ast.parse(source)
+        except SyntaxError as error:
+            # e.g. syntax of a newer Python version than the one running the build, Pyodide might still run it
+            print(f"{path}: cannot check the packages of this app, {error}")
+            return None
+        imported.update(_deps._find_imports(source))
+        lazy.update(name.split(".")[0] for name in re.findall(r"lazy_import\(\s*[\"']([\w.]+)", source))
+    if uses_shared_package(app_dir):
+        for path in shared_package.rglob("*.py"):
+            imported.update(_deps._find_imports(path.read_text(encoding="utf-8")))
+    used = {normalize_package(_deps.module_to_package_key(module) or module) for module in imported | lazy}
+
+    requirements_path = Path(app_dir, "requirements.txt")
+    requirements = set()
+    if requirements_path.exists():
+        requirements = {normalize_package(name)
+                        for name in _deps._find_packages_in_requirements(requirements_path.read_text())}
+    lazy_packages = {normalize_package(_deps.module_to_package_key(module) or module) for module in lazy}
+
+    if requirements - used:
+        raise ValueError(f"{requirements_path} lists {', '.join(sorted(requirements - used))}, which the app does "
+                         f"not import. Remove them to keep them from being downloaded.")
+    if lazy_packages - requirements:
+        raise ValueError(f"{app_dir} imports {', '.join(sorted(lazy_packages - requirements))} with lazy_import, "
+                         f"add them to its requirements.txt.")
+
+    # shinylive loads shiny and its dependencies for every app
+    base_wheels = package_wheels(_deps.BASE_PYODIDE_PACKAGE_NAMES | {"shiny"})
+    return {name: size for name, size in package_wheels(used | requirements).items() if name not in base_wheels}
+
+
+def export_app(app_dir, app_path, target_shinypath):
+    start = time.perf_counter()
+    if shared_assets:
+        # Files of an earlier export may be hard-linked to other apps, writing them in place would change those too
+        shutil.rmtree(Path("./site", target_shinypath), ignore_errors=True)
+    os.makedirs(Path("./site", target_shinypath), exist_ok=True)
+    with tempfile.TemporaryDirectory() as staging_dir:
+        if uses_shared_package(app_dir):
+            # shinylive only bundles the files in the app directory, so export a copy that includes the package
+            ignore = shutil.ignore_patterns("__pycache__")
+            shutil.copytree(app_dir, Path(staging_dir, "app"), ignore=ignore)
+            shutil.copytree(shared_package, Path(staging_dir, "app", shared_package.name), ignore=ignore)
+            app_dir = Path(staging_dir, "app")
+        _export.export(app_dir, Path("./site"), subdir=target_shinypath, verbose=False, full_shinylive=True)
+
+    # Copy source code incase the embed_code macro is used
+    shutil.copyfile(app_path, Path("./site", target_shinypath, "app.py"))
+    return time.perf_counter() - start
+
+
+build_start = time.perf_counter()
+apps = []
 for file_path in sorted(Path("docs").glob("**/app.md")):
     file_path = file_path.relative_to("docs") # e.g. "docs/blog/PlotlyPenguins/app.md"
     parts = Path(file_path).parts
@@ -44,8 +210,77 @@ for file_path in sorted(Path("docs").glob("**/app.md")):
             target_apppath = Path(base_apppath, subdirparts[0])
             target_shinypath = Path(str(base_shinypath) +  '_' + str(subdirparts[0]))
 
-        os.makedirs(Path("./site", target_shinypath), exist_ok=True)
-        _export.export(target_apppath, Path("./site"), subdir=target_shinypath, verbose=True, full_shinylive=True)
+        apps.append((target_apppath, app_path, target_shinypath))
+
+manifest = {}
+if manifest_path.exists():
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+
+# check_packages reads the pyodide lock file of the shinylive assets, download them first on a fresh machine
+ensure_shinylive_assets()
+
+hashes = {}
+wheels = {}
+stale_apps = []
+for target_apppath, app_path, target_shinypath in apps:
+    key = Path(target_shinypath).as_posix()
+    hashes[key] = hash_app(target_apppath)
+    wheels[key] = check_packages(target_apppath)
+    exported = Path("./site", target_shinypath, "app.json").exists()
+    if exported and manifest.get(key, {}).get("hash") == hashes[key]:
+        print(f"{key}: unchanged, skipping export")
+    else:
+        stale_apps.append((target_apppath, app_path, target_shinypath))
+
+timings = {}
+if stale_apps:
+    # The first export copies the shared shinylive runtime to ./site/shinylive, all later exports find it in place.
+    # Installing it beforehand (or running the first export on its own) keeps the worker processes from writing the
+    # same runtime files concurrently.
+    if shared_assets:
+        installed = install_runtime()
+        print(f"Installed {installed / 2**20:.1f} MiB of shinylive runtime to ./site/shinylive")
+        other_apps = stale_apps
+    else:
+        first_app, *other_apps = stale_apps
+        timings[Path(first_app[2]).as_posix()] = export_app(*first_app)
+
+    # Worker processes are forked, as this script is executed by mkdocs-gen-files and cannot be re-imported by a
+    # spawned process. Platforms without fork export the remaining apps one after another.
+    if other_apps and "fork" in multiprocessing.get_all_start_methods():
+        with concurrent.futures.ProcessPoolExecutor(mp_context=multiprocessing.get_context("fork")) as executor:
+            futures = {executor.submit(export_app, *app): Path(app[2]).as_posix() for app in other_apps}
+            for future in concurrent.futures.as_completed(futures):
+                timings[futures[future]] = future.result()
+    else:
+        for app in other_apps:
+            timings[Path(app[2]).as_posix()] = export_app(*app)
+
+for key, seconds in sorted(timings.items()):
+    print(f"{key}: exported in {seconds:.1f}s")
+print(f"Exported {len(timings)} of {len(apps)} apps in {time.perf_counter() - build_start:.1f}s")
+
+if shared_assets and timings:
+    # Exported apps are removed before they are exported again, so they are never written in place either
+    saved = deduplicate([Path("./site", "shinylive")] + [Path("./site", app[2]) for app in apps])
+    print(f"Hard-linked identical files in ./site/shinylive and the apps, {saved / 2**20:.1f} MiB saved")
+
+# Wheels each app downloads on start, compared to the last build
+removed = 0
+for key, app_wheels in sorted(wheels.items()):
+    if app_wheels is None:
+        continue
+    wheel_bytes = sum(app_wheels.values())
+    change = ""
+    if manifest.get(key, {}).get("wheel_bytes") is not None:
+        removed += manifest[key]["wheel_bytes"] - wheel_bytes
+        change = f", {(manifest[key]['wheel_bytes'] - wheel_bytes) / 2**20:+.1f} MiB removed since the last build"
+    print(f"{key}: loads {', '.join(sorted(app_wheels)) or 'only the base packages'} "
+          f"({wheel_bytes / 2**20:.1f} MiB{change})")
+print(f"{removed / 2**20:.1f} MiB of wheels removed from all apps since the last build")
 
-        # Copy source code incase the embed_code macro is used
-        shutil.copyfile(app_path, Path("./site", target_shinypath, "app.py"))
+with open(manifest_path, "w") as f:
+    json.dump({key: {"hash": app_hash, "seconds": timings.get(key, manifest.get(key, {}).get("seconds")),
+                     "wheel_bytes": sum(wheels[key].values()) if wheels[key] is not None else None}
+               for key, app_hash in hashes.items()}, f, indent=2)
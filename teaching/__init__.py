@@ -0,0 +1 @@
+"""Code shared by the apps, gen_shinylive.py bundles this package into every exported app that imports it."""
@@ -0,0 +1,55 @@
+"""Colormaps shared by the apps.
+
+The colormaps are built on first access, e.g. `colormaps.berlin`, so apps only pay for the ones (and the plotting
+library) they actually use. Import the module, not the names, to keep it that way: `from teaching import colormaps`.
+matplotlib is imported lazily, so apps that use the matplotlib colormaps have to import matplotlib themselves.
+"""
+import functools
+from pathlib import Path
+import numpy as np
+from teaching.lazy import lazy_import
+
+mcolors = lazy_import("matplotlib.colors")
+
+
+@functools.cache
+def load_table(name):
+    """256 x 3 table of rgb values in [0, 1], stored as float32 with six significant decimals."""
+    return np.load(Path(__file__).with_name(f"{name}.npy")).astype(np.float64).round(6)
+
+
+def rgb_normalized_to_plotly(rgb_colors):
+    colorscale = []
+    n_colors = len(rgb_colors)
+
+    for i, rgb in enumerate(rgb_colors):
+        position = i / (n_colors - 1)
+        color = f'rgb({int(rgb[0] * 255)}, {int(rgb[1] * 255)}, {int(rgb[2] * 255)})'
+        colorscale.append([position, color])
+
+    return colorscale
+
+
+@functools.cache
+def matplotlib_cmap(name):
+    return mcolors.LinearSegmentedColormap.from_list(name, load_table(name), N=256)
+
+
+@functools.cache
+def plotly_colorscale(name):
+    return rgb_normalized_to_plotly(load_table(name))
+
+
+# Taken from F. Crameri's scientific-colour-maps version 8.0.1.  https://doi.org/10.5281/zenodo.1243862 (included by
+# default in newer matplotlib versions)
+lazy_colormaps = {
+    "berlin_cmap": lambda: load_table("berlin"),
+    "berlin": lambda: matplotlib_cmap("berlin"),
+    "berlin_plotly": lambda: plotly_colorscale("berlin"),
+}
+
+
+def __getattr__(name):
+    if name in lazy_colormaps:
+        return lazy_colormaps[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
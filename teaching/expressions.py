@@ -0,0 +1,153 @@
+"""Formulas entered by users, compiled once into vectorised NumPy functions.
+
+    f = expressions.compile_expression("e^(-x^2) * sin(x)", "x")
+    y = f(np.linspace(-5, 5, 1001))
+
+The formula is parsed into an AST, which may only contain numbers, the given variables, pi, e, the functions below
+and arithmetic. Constant parts such as `2*pi` are folded, and the result is compiled into a function of the variables.
+Compiled functions are cached on the normalised formula, so `x^2` and `x ** 2` share one function, and evaluating a
+formula on a new grid is a plain function call.
+"""
+import ast
+import functools
+import operator
+import numpy as np
+
+functions = {
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "arcsin": np.arcsin,
+    "arccos": np.arccos,
+    "arctan": np.arctan,
+    "sinh": np.sinh,
+    "cosh": np.cosh,
+    "tanh": np.tanh,
+    "exp": np.exp,
+    "log": np.log,
+    "log10": np.log10,
+    "sqrt": np.sqrt,
+    "abs": np.abs,
+}
+constants = {"pi": np.pi, "e": np.e}
+
+binary_operators = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+    ast.Mod: operator.mod,
+}
+unary_operators = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+
+
+def parse(text):
+    """AST of the formula, `^` is read as power as it is commonly typed that way."""
+    try:
+        return ast.parse(text.strip().replace("^", "**"), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid formula {text!r}: {e.msg}") from None
+
+
+@functools.lru_cache(maxsize=256)
+def normalise(text):
+    """Canonical spelling of the formula, used as cache key."""
+    return ast.unparse(parse(text))
+
+
+class Checker(ast.NodeTransformer):
+    """Rejects everything but arithmetic on numbers, variables and whitelisted functions, folds constant parts."""
+
+    def __init__(self, variables):
+        self.variables = variables
+
+    def generic_visit(self, node):
+        raise ValueError(f"{type(node).__name__} is not allowed in a formula")
+
+    def visit_Expression(self, node):
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float, complex)):
+            raise ValueError(f"{node.value!r} is not a number")
+        return node
+
+    def visit_Name(self, node):
+        if node.id in self.variables:
+            return node
+        if node.id in constants:
+            return ast.copy_location(ast.Constant(constants[node.id]), node)
+        raise ValueError(f"Unknown name {node.id!r}, use one of {', '.join(self.variables + tuple(constants))}")
+
+    def visit_Attribute(self, node):
+        # np.pi and np.sin(x) were accepted before, they are the same as pi and sin(x)
+        if isinstance(node.value, ast.Name) and node.value.id == "np" and node.attr in constants:
+            return ast.copy_location(ast.Constant(constants[node.attr]), node)
+        raise ValueError(f"Unknown name {ast.unparse(node)!r}")
+
+    def visit_BinOp(self, node):
+        if type(node.op) not in binary_operators:
+            raise ValueError(f"Operator {type(node.op).__name__} is not allowed in a formula")
+        node.left, node.right = self.visit(node.left), self.visit(node.right)
+        return self.fold(node, binary_operators[type(node.op)], [node.left, node.right])
+
+    def visit_UnaryOp(self, node):
+        if type(node.op) not in unary_operators:
+            raise ValueError(f"Operator {type(node.op).__name__} is not allowed in a formula")
+        node.operand = self.visit(node.operand)
+        return self.fold(node, unary_operators[type(node.op)], [node.operand])
+
+    def visit_Call(self, node):
+        name = node.func.id if isinstance(node.func, ast.Name) else \
+            node.func.attr if isinstance(node.func, ast.Attribute) and ast.unparse(node.func.value) == "np" else None
+        if name not in functions:
+            raise ValueError(f"Unknown function {ast.unparse(node.func)!r}, use one of {', '.join(functions)}")
+        node.func = ast.copy_location(ast.Name(name, ast.Load()), node.func)
+        if len(node.args) != 1 or node.keywords:
+            raise ValueError(f"{name} takes exactly one argument")
+        node.args = [self.visit(node.args[0])]
+        return self.fold(node, functions[node.func.id], node.args)
+
+    @staticmethod
+    def fold(node, function, operands):
+        """Replaces the node by its value if all operands are numbers, with NumPy semantics (2**-1 = 0.5)."""
+        if not all(isinstance(operand, ast.Constant) for operand in operands):
+            return node
+        values = [np.complex128(o.value) if isinstance(o.value, complex) else np.float64(o.value) for o in operands]
+        with np.errstate(all="ignore"):
+            try:
+                value = function(*values)
+            except ArithmeticError:
+                return node
+        return ast.copy_location(ast.Constant(value.item()), node)
+
+
+@functools.lru_cache(maxsize=256)
+def check(text, variables):
+    """Checked and constant-folded AST of a normalised formula, shared by everything built from it."""
+    return Checker(variables).visit(parse(text))
+
+
+@functools.lru_cache(maxsize=256)
+def compile_normalised(text, variables):
+    tree = check(text, variables)
+    arguments = ast.arguments(posonlyargs=[], args=[ast.arg(name) for name in variables], kwonlyargs=[],
+                              kw_defaults=[], defaults=[])
+    code = compile(ast.fix_missing_locations(ast.Expression(ast.Lambda(arguments, tree.body))), "<formula>", "eval")
+    evaluate = eval(code, {"__builtins__": {}, **functions})
+
+    def function(*values):
+        result = evaluate(*values)
+        # Constant formulas like 0 still give a value for every point of the grid
+        shape = np.broadcast_shapes(*(np.shape(value) for value in values))
+        return result if np.shape(result) == shape else np.broadcast_to(result, shape).copy()
+
+    function.formula = text
+    return function
+
+
+def compile_expression(text, *variables):
+    """Vectorised function of the variables computing the formula, raises ValueError for invalid formulas."""
+    return compile_normalised(normalise(text), variables)
@@ -0,0 +1,24 @@
+"""Modules that are imported on first use instead of at app start.
+
+    pd = lazy_import("pandas")
+    ...
+    df = pd.DataFrame(...)  # pandas is imported here
+
+Pyodide finds the packages of an app by scanning its `import` statements, which do not see these imports. A package
+that is only imported lazily therefore has to be listed in the requirements.txt of the app, gen_shinylive.py checks
+that. It is then still downloaded at start, but no longer initialised before the first render needs it.
+"""
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attribute)
+
+
+def lazy_import(name):
+    """Module proxy for name, the module is imported when the first attribute is accessed."""
+    return LazyModule(name)
@@ -0,0 +1,53 @@
+import numpy as np
+
+from teaching import series
+
+
+def test_integer_power_at_a_zero_of_the_base():
+    np.testing.assert_array_equal(series.taylor_coefficients("x**70", "x", 0.0, 4), np.zeros(5))
+    np.testing.assert_allclose(series.taylor_coefficients("x**70", "x", 1.0, 2), [1, 70, 70 * 69 / 2])
+
+
+def test_negative_integer_power():
+    np.testing.assert_allclose(series.taylor_coefficients("x**-3", "x", 2.0, 2), [1 / 8, -3 / 16, 6 / 32])
+
+
+def test_abs_away_from_the_kink():
+    np.testing.assert_array_equal(series.taylor_coefficients("abs(x)", "x", -2.0, 2), [2, -1, 0])
+
+
+def test_abs_at_the_kink():
+    c = series.taylor_coefficients("abs(x)", "x", 0.0, 3)
+    assert c[0] == 0
+    assert np.all(np.isnan(c[1:]))
+
+
+def test_abs_at_many_centers():
+    c = series.coefficients("abs(x)", "x", np.array([-1.0, 0.0, 1.0]), 1)
+    np.testing.assert_array_equal(c[:, [0, 2]], [[1, 1], [-1, 1]])
+    assert np.isnan(c[1, 1])
+
+
+def test_radius_of_a_pole_of_high_order():
+    np.testing.assert_allclose(series.convergence_radius("1/(1-x)**12", "x", 0.0), 1, rtol=1e-3)
+
+
+def test_radius_of_branch_points_and_complex_poles():
+    np.testing.assert_allclose(series.convergence_radius("log(x)", "x", 0.1), 0.1, rtol=1e-3)
+    np.testing.assert_allclose(series.convergence_radius("1/(1+x^2)", "x", 0.5), np.sqrt(1.25), rtol=2e-2)
+
+
+def test_radius_where_not_analytic():
+    assert series.convergence_radius("abs(x)", "x", 0.0) == 0
+    assert series.convergence_radius("sqrt(x)", "x", 0.0) == 0
+
+
+def test_radius_of_polynomials():
+    assert series.convergence_radius("x**70", "x", 0.0) == np.inf
+    assert series.convergence_radius("x**70", "x", 1.0) == np.inf
+    assert series.convergence_radius("x^3 + 2", "x", 1.0) == np.inf
+
+
+def test_radius_of_entire_functions():
+    for text in ("exp(x)", "cos(x)", "exp(-x**2)", "exp(-x**4)"):
+        assert series.convergence_radius(text, "x", 0.0) == np.inf, text